@@ -0,0 +1,56 @@
+"""
+Embedding 缓存
+
+聊天界面经常重复发送相同的消息，Mem0 每次都会重新调用 Embedder。
+这里按内容哈希缓存 Embedder 的结果，相同文本直接复用已有向量。
+
+Embedder 会在 mem0 线程池以及 Mem0 内部的线程中被调用，缓存访问需要加锁。
+"""
+
+import hashlib
+import logging
+import threading
+from typing import Any
+
+import numpy as np
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def patch_embedding_cache(*embedders: Any, maxsize: int = 4096, ttl: float = 86400):
+    """
+    给 Embedder 实例的 embed 方法加上按内容哈希的缓存，多个实例共享同一个缓存。
+
+    Args:
+        embedders: Mem0 的 Embedder 实例（如 Memory.embedding_model、MemoryGraph.embedding_model）
+        maxsize: 缓存的最大向量数
+        ttl: 缓存有效期（秒）
+    """
+    cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+    lock = threading.Lock()
+
+    for embedder in embedders:
+        original_embed = embedder.embed
+
+        def cached_embed(text, memory_action=None, _original_embed=original_embed):
+            """修补后的 embed 方法，命中缓存时跳过 Embedder 调用"""
+            if not isinstance(text, str):
+                return _original_embed(text, memory_action)
+
+            # 部分 Embedder 会根据 memory_action 生成不同的向量，因此作为键的一部分
+            key = (memory_action, hashlib.blake2b(text.encode(), digest_size=16).digest())
+            with lock:
+                vector = cache.get(key)
+            if vector is not None:
+                return vector.tolist()
+
+            embedding = _original_embed(text, memory_action)
+            # 以 float32 数组保存，比 Python float 列表节省约 8 倍内存
+            with lock:
+                cache[key] = np.asarray(embedding, dtype=np.float32)
+            return embedding
+
+        embedder.embed = cached_embed
+
+    logger.info(f"Embedding cache enabled for {len(embedders)} embedder(s) (maxsize={maxsize}, ttl={ttl}s)")
@@ -1,24 +1,32 @@
+import asyncio
+import hmac
 import logging
-import math
 import os
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse, RedirectResponse
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import FastAPI, HTTPException, Query, Request, Depends
+from fastapi.responses import ORJSONResponse, RedirectResponse, Response
+from fastapi.security.http import HTTPAuthorizationCredentials, HTTPBase
 from pydantic import BaseModel, Field
 
 from mem0 import Memory
+from psycopg_pool import ConnectionPool
 
-# 导入并应用 Neo4j 5.x 兼容性补丁
+from embedding_cache import patch_embedding_cache
+# Neo4j 5.x 兼容性补丁
 from neo4j_patch import apply_all_patches
+from pg_pool import create_connection_pool, ping_pool
+from pgvector_index import ensure_hnsw_index, patch_pgvector_binary_search, restore_pgvector_search
+from search_cache import SearchCache
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# 在导入 Memory 后立即应用补丁
-apply_all_patches()
-
 # Load environment variables
 load_dotenv()
 
@@ -31,6 +39,8 @@ POSTGRES_DB = os.environ.get("POSTGRES_DB", "postgres")
 POSTGRES_USER = os.environ.get("POSTGRES_USER", "postgres")
 POSTGRES_PASSWORD = os.environ.get("POSTGRES_PASSWORD", "postgres")
 POSTGRES_COLLECTION_NAME = os.environ.get("POSTGRES_COLLECTION_NAME", "memories")
+POSTGRES_POOL_MIN_SIZE = int(os.environ.get("POSTGRES_POOL_MIN_SIZE", "4"))
+POSTGRES_POOL_MAX_SIZE = int(os.environ.get("POSTGRES_POOL_MAX_SIZE", os.environ.get("MEM0_WORKERS", "32")))
 
 NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://neo4j:7687")
 NEO4J_USERNAME = os.environ.get("NEO4J_USERNAME", "neo4j")
@@ -52,6 +62,32 @@ OPENAI_CHAT_MODEL = os.environ.get("OPENAI_CHAT_MODEL", "GLM-4.6-FP8")
 OPENAI_EMBEDDING_MODEL = os.environ.get("OPENAI_EMBEDDING_MODEL", "nvidia_embed")
 EMBEDDING_MODEL_DIMS = int(os.environ.get("EMBEDDING_MODEL_DIMS", "4096"))
 
+# pgvector HNSW 索引配置
+PGVECTOR_HNSW_ENABLED = os.environ.get("PGVECTOR_HNSW_ENABLED", "true").lower() == "true"
+PGVECTOR_HNSW_M = int(os.environ.get("PGVECTOR_HNSW_M", "24"))
+PGVECTOR_HNSW_EF_CONSTRUCTION = int(os.environ.get("PGVECTOR_HNSW_EF_CONSTRUCTION", "128"))
+PGVECTOR_HNSW_EF_SEARCH = int(os.environ.get("PGVECTOR_HNSW_EF_SEARCH", "100"))
+# 启动时是否升级 vector 扩展到镜像自带的版本（扩展按数据库安装，只影响 POSTGRES_DB）
+PGVECTOR_UPDATE_EXTENSION = os.environ.get("PGVECTOR_UPDATE_EXTENSION", "false").lower() == "true"
+# 二值量化索引（超过 4000 维时自动启用），搜索时取 limit * PGVECTOR_RERANK_FACTOR 个候选重排
+PGVECTOR_BINARY_QUANTIZATION = os.environ.get("PGVECTOR_BINARY_QUANTIZATION", "false").lower() == "true"
+PGVECTOR_RERANK_FACTOR = int(os.environ.get("PGVECTOR_RERANK_FACTOR", "4"))
+
+# Embedding 缓存配置，EMBEDDING_CACHE_SIZE 为 0 表示禁用
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_TTL = float(os.environ.get("EMBEDDING_CACHE_TTL", "86400"))
+
+# uvicorn worker 进程数（与 Dockerfile 中的 WORKERS 相同）
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+# 搜索缓存配置，SEARCH_CACHE_SIZE 为 0 表示禁用
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "10000"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "300"))
+SEARCH_SEMANTIC_CACHE_SIZE = int(os.environ.get("SEARCH_SEMANTIC_CACHE_SIZE", "64"))  # 每个作用域保留的查询向量数，0 表示禁用语义缓存
+SEARCH_SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEARCH_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+# 单次批量搜索的最大查询数，避免一个请求占满 mem0 线程池
+SEARCH_BATCH_MAX_SIZE = int(os.environ.get("SEARCH_BATCH_MAX_SIZE", "32"))
+
 # 是否启用 Graph Store
 GRAPH_STORE_ENABLED = os.environ.get("GRAPH_STORE_ENABLED", "true").lower() == "true"
 
@@ -83,7 +119,7 @@ DEFAULT_CONFIG = {
             "password": POSTGRES_PASSWORD,
             "collection_name": POSTGRES_COLLECTION_NAME,
             "embedding_model_dims": EMBEDDING_MODEL_DIMS,  # nvidia/NV-Embed-v2 的维度
-            "hnsw": False,  # 禁用 HNSW 索引（不支持 > 2000 维）
+            "hnsw": False,  # HNSW 索引由 ensure_hnsw_index 创建（> 2000 维时使用 halfvec，> 4000 维时使用二值量化）
             "diskann": False,  # 禁用 DiskANN 索引
         },
     },
@@ -103,39 +139,145 @@ else:
     logging.info("Graph Store disabled")
 
 
-MEMORY_INSTANCE = Memory.from_config(DEFAULT_CONFIG)
+# mem0 的调用（Embedder / pgvector / Neo4j）都是阻塞 I/O，放到独立线程池执行，避免占用事件循环
+MEM0_WORKERS = int(os.environ.get("MEM0_WORKERS", "32"))
+EXECUTOR = ThreadPoolExecutor(max_workers=MEM0_WORKERS, thread_name_prefix="mem0")
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """在 mem0 专用线程池中执行阻塞调用"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, partial(func, *args, **kwargs))
+
+
+# 搜索缓存只在当前进程内失效，多 worker 时其他进程会继续返回已删除或过期的记忆
+if WORKERS > 1 and SEARCH_CACHE_SIZE > 0:
+    logging.warning(f"Search cache is per process, disabling it for WORKERS={WORKERS}")
+    SEARCH_CACHE_SIZE = 0
+
+# 语义缓存需要先对查询做 Embedding，Mem0 搜索时会再做一次；没有 Embedding 缓存时每次未命中都会多一次 Embedder 调用
+if SEARCH_SEMANTIC_CACHE_SIZE > 0 and EMBEDDING_CACHE_SIZE <= 0:
+    logging.warning("Semantic search cache requires EMBEDDING_CACHE_SIZE > 0, disabling it")
+    SEARCH_SEMANTIC_CACHE_SIZE = 0
+
+SEARCH_CACHE = SearchCache(
+    maxsize=SEARCH_CACHE_SIZE,
+    ttl=SEARCH_CACHE_TTL,
+    semantic_size=SEARCH_SEMANTIC_CACHE_SIZE,
+    semantic_threshold=SEARCH_SEMANTIC_CACHE_THRESHOLD,
+)
+
+
+class MemoryJSONResponse(ORJSONResponse):
+    """
+    使用 orjson 序列化响应，NaN 和无穷大会被直接输出为 null。
+
+    直接返回该响应时 FastAPI 不会再经过 jsonable_encoder，Mem0 的结果只序列化一次。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def ensure_vector_index():
+    """创建 pgvector HNSW 索引，使用二值量化索引时替换 Mem0 的搜索方法"""
+    if not PGVECTOR_HNSW_ENABLED:
+        return
+    index_type = None
+    try:
+        index_type = ensure_hnsw_index(
+            DEFAULT_CONFIG["vector_store"]["config"],
+            m=PGVECTOR_HNSW_M,
+            ef_construction=PGVECTOR_HNSW_EF_CONSTRUCTION,
+            binary_quantization=PGVECTOR_BINARY_QUANTIZATION,
+            update_extension=PGVECTOR_UPDATE_EXTENSION,
+        )
+    except Exception:
+        logging.exception("Failed to create pgvector HNSW index, falling back to sequential scan")
+
+    # 二值量化的搜索 SQL 只有在索引存在时才比 Mem0 原始查询快（reset 后重建失败时需要恢复）
+    if index_type == "binary":
+        patch_pgvector_binary_search(EMBEDDING_MODEL_DIMS, rerank_factor=PGVECTOR_RERANK_FACTOR)
+    else:
+        restore_pgvector_search()
+
+
+def create_memory() -> Tuple[Memory, ConnectionPool]:
+    """创建连接池和 Mem0 实例，并启用 Embedding 缓存和 HNSW 索引"""
+    # 在创建 Memory 前应用补丁
+    apply_all_patches()
+
+    # 预先创建连接池注入给 Mem0，替代其默认的小连接池
+    # 需要 mem0ai >= 1.0.0：更早的版本在初始化时会 deepcopy 向量库配置，而连接池无法被复制
+    pg_pool = create_connection_pool(
+        DEFAULT_CONFIG["vector_store"]["config"],
+        min_size=POSTGRES_POOL_MIN_SIZE,
+        max_size=POSTGRES_POOL_MAX_SIZE,
+        # 新连接默认使用配置的 hnsw.ef_search；带过滤条件（user_id 等）时继续扫描索引，避免结果不足 limit 条
+        options=(
+            f"-c hnsw.ef_search={PGVECTOR_HNSW_EF_SEARCH} -c hnsw.iterative_scan=strict_order"
+            if PGVECTOR_HNSW_ENABLED
+            else None
+        ),
+    )
+    vector_store = DEFAULT_CONFIG["vector_store"]
+    config = {**DEFAULT_CONFIG, "vector_store": {**vector_store, "config": {**vector_store["config"], "connection_pool": pg_pool}}}
+
+    memory = Memory.from_config(config)
+
+    if EMBEDDING_CACHE_SIZE > 0:
+        embedders = [memory.embedding_model]
+        if getattr(memory, "graph", None) is not None:
+            embedders.append(memory.graph.embedding_model)
+        patch_embedding_cache(*embedders, maxsize=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL)
+
+    ensure_vector_index()
+
+    return memory, pg_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 在线程池中初始化，模块导入时不再连接 Postgres / Neo4j / Embedder
+    app.state.memory, app.state.pg_pool = await run_in_executor(create_memory)
+    try:
+        yield
+    finally:
+        EXECUTOR.shutdown(wait=True)
+        app.state.pg_pool.close()
+
 
 app = FastAPI(
     title="Mem0 REST APIs",
     description="A REST API for managing and searching memories for your AI Agents and Apps.",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=MemoryJSONResponse,
 )
 
 # 安全相关
-security = HTTPBearer(auto_error=False)
-def verify_api_key(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[str]:
+# HTTPBearer 只接受 Bearer 格式，这里使用 HTTPBase 以便同时支持 Token 格式
+security = HTTPBase(scheme="bearer", description="Bearer token 或 Token token", auto_error=False)
+API_KEY_BYTES = API_KEY.encode() if API_KEY else None
+
+
+def verify_api_key(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[str]:
     """验证API Key - 如果设置了API_KEY环境变量则需要认证，支持Bearer和Token两种格式"""
     if not API_KEY:
         return None
-    
-    # 从Authorization头获取token
-    auth_header = request.headers.get("Authorization")
-    if not auth_header:
+
+    if not credentials:
         raise HTTPException(status_code=401, detail="Authorization header required")
-    
+
     # 支持两种格式: "Bearer token" 和 "Token token"
-    token = None
-    if auth_header.startswith("Bearer "):
-        token = auth_header[7:]  # 去掉 "Bearer " 前缀
-    elif auth_header.startswith("Token "):
-        token = auth_header[6:]  # 去掉 "Token " 前缀
-    else:
+    if credentials.scheme.lower() not in ("bearer", "token"):
         raise HTTPException(status_code=401, detail="Invalid authorization format. Use 'Bearer token' or 'Token token'")
-    
-    if token != API_KEY:
+
+    # 使用常量时间比较，避免通过响应时间推测 API Key
+    if not hmac.compare_digest(credentials.credentials.encode(), API_KEY_BYTES):
         raise HTTPException(status_code=401, detail="Invalid API Key")
-    
-    return token
+
+    return credentials.credentials
 
 
 class Message(BaseModel):
@@ -163,117 +305,175 @@ class SearchRequest(BaseModel):
     limit: int = 50
 
 
-def clean_nan_values(obj):
-    """递归清理对象中的NaN值和无穷大值，将其替换为None"""
-    if isinstance(obj, dict):
-        return {k: clean_nan_values(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [clean_nan_values(item) for item in obj]
-    elif isinstance(obj, float):
-        if math.isnan(obj) or math.isinf(obj):
-            return None
-        else:
-            return obj
-    else:
-        return obj
+class BatchSearchRequest(BaseModel):
+    requests: List[SearchRequest] = Field(..., max_length=SEARCH_BATCH_MAX_SIZE, description="List of search requests.")
+
+
+# Mem0 get_all 未指定 limit 时返回的最大条数
+GET_ALL_DEFAULT_LIMIT = 100
+
+
+def identifier_params(**identifiers: Optional[str]) -> Dict[str, str]:
+    """过滤掉未提供的标识参数"""
+    return {k: v for k, v in identifiers.items() if v is not None}
+
+
+def dump_ndjson(result: Any) -> bytes:
+    """每行一条记忆（NDJSON），图关系（如有）作为最后一行 {"relations": [...]} 输出"""
+    items = result.get("results", []) if isinstance(result, dict) else result
+    lines = [orjson.dumps(item, default=str) for item in items]
+    if isinstance(result, dict) and result.get("relations") is not None:
+        lines.append(orjson.dumps({"relations": result["relations"]}, default=str))
+    return b"".join(line + b"\n" for line in lines)
+
+
+def paginate(result: Any, offset: int, limit: Optional[int]) -> Any:
+    """对 get_all 的结果按 offset/limit 切片"""
+    end = offset + limit if limit is not None else None
+    if isinstance(result, dict) and "results" in result:
+        return {**result, "results": result["results"][offset:end]}
+    if isinstance(result, list):
+        return result[offset:end]
+    return result
 
 
 @app.post("/memories/", summary="Create memories")
-def add_memory(request: Request, memory_create: MemoryCreate, auth: str = Depends(verify_api_key)):
+async def add_memory(request: Request, memory_create: MemoryCreate, auth: str = Depends(verify_api_key)):
     """Store new memories."""
     if not any([memory_create.user_id, memory_create.agent_id, memory_create.run_id]):
         raise HTTPException(status_code=400, detail="At least one identifier (user_id, agent_id, run_id) is required.")
 
-    params = {k: v for k, v in memory_create.model_dump().items() if v is not None and k != "messages"}
+    params = memory_create.model_dump(exclude_none=True, exclude={"messages"})
     try:
-        response = MEMORY_INSTANCE.add(messages=[m.model_dump() for m in memory_create.messages], **params)
-        cleaned_response = clean_nan_values(response)
-        return JSONResponse(content=cleaned_response)
+        response = await run_in_executor(
+            request.app.state.memory.add, messages=[m.model_dump() for m in memory_create.messages], **params
+        )
+        SEARCH_CACHE.invalidate(memory_create.user_id, memory_create.agent_id, memory_create.run_id)
+        return MemoryJSONResponse(response)
     except Exception as e:
         logging.exception("Error in add_memory:")  # This will log the full traceback
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/memories/", summary="Get memories")
-def get_all_memories(
+async def get_all_memories(
     request: Request,
     user_id: Optional[str] = None,
     run_id: Optional[str] = None,
     agent_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of memories to return."),
+    offset: int = Query(
+        0, ge=0, description="Number of memories to skip. The store returns memories in no fixed order, so pages may overlap."
+    ),
     auth: str = Depends(verify_api_key),
 ):
-    """Retrieve stored memories."""
+    """Retrieve stored memories. Send `Accept: application/x-ndjson` to receive one memory per line."""
     if not any([user_id, run_id, agent_id]):
         raise HTTPException(status_code=400, detail="At least one identifier is required.")
     try:
-        params = {
-            k: v for k, v in {"user_id": user_id, "run_id": run_id, "agent_id": agent_id}.items() if v is not None
-        }
-        return MEMORY_INSTANCE.get_all(**params)
+        params = identifier_params(user_id=user_id, run_id=run_id, agent_id=agent_id)
+        # Mem0 只支持 limit（默认 100），offset 通过多取 offset 条再切片实现
+        # pgvector 的 list 查询没有 ORDER BY，不同请求之间的分页顺序并不稳定
+        if offset or limit is not None:
+            params["limit"] = offset + (limit or GET_ALL_DEFAULT_LIMIT)
+        result = await run_in_executor(request.app.state.memory.get_all, **params)
+        if offset or limit is not None:
+            result = paginate(result, offset, limit)
+
+        if "application/x-ndjson" in request.headers.get("accept", ""):
+            return Response(dump_ndjson(result), media_type="application/x-ndjson")
+        return MemoryJSONResponse(result)
     except Exception as e:
         logging.exception("Error in get_all_memories:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/memories/{memory_id}", summary="Get a memory")
-def get_memory(request: Request, memory_id: str, auth: str = Depends(verify_api_key)):
+async def get_memory(request: Request, memory_id: str, auth: str = Depends(verify_api_key)):
     """Retrieve a specific memory by ID."""
     try:
-        result = MEMORY_INSTANCE.get(memory_id)
-        cleaned_result = clean_nan_values(result)
-        return cleaned_result
+        result = await run_in_executor(request.app.state.memory.get, memory_id)
+        return MemoryJSONResponse(result)
     except Exception as e:
         logging.exception("Error in get_memory:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def cached_search(memory: Memory, search_req: SearchRequest) -> Any:
+    """先查搜索缓存（精确匹配、语义匹配），未命中时调用 Mem0 搜索并写入缓存"""
+    logging.debug("search threshold=%s limit=%s", search_req.threshold, search_req.limit)
+    params = search_req.model_dump(exclude_none=True, exclude={"query"})
+    scope = SEARCH_CACHE.make_scope(params)
+    cached = SEARCH_CACHE.get(scope, search_req.query)
+    if cached is not None:
+        return cached
+
+    generation = SEARCH_CACHE.generation
+    embedding = None
+    if SEARCH_CACHE.semantic_enabled:
+        # 这里的结果会进入 Embedding 缓存，随后 Mem0 搜索时直接命中
+        embedding = await run_in_executor(memory.embedding_model.embed, search_req.query, "search")
+        cached = SEARCH_CACHE.get_similar(scope, embedding)
+        if cached is not None:
+            SEARCH_CACHE.put(scope, search_req.query, cached, generation=generation)
+            return cached
+
+    value = await run_in_executor(memory.search, query=search_req.query, **params)
+    SEARCH_CACHE.put(scope, search_req.query, value, embedding, generation=generation)
+    return value
+
+
 @app.post("/search", summary="Search memories")
-def search_memories(request: Request, search_req: SearchRequest, auth: str = Depends(verify_api_key)):
+async def search_memories(request: Request, search_req: SearchRequest, auth: str = Depends(verify_api_key)):
     """Search for memories based on a query."""
     try:
-        
-        print("threshold：",search_req.threshold);
-        print("limit：",search_req.limit);
-
-        params = {k: v for k, v in search_req.model_dump().items() if v is not None and k != "query"}
-        value = MEMORY_INSTANCE.search(query=search_req.query, **params)
-        # 清理结果中的NaN值
-        cleaned_value = clean_nan_values(value)
-        return cleaned_value
+        return MemoryJSONResponse(await cached_search(request.app.state.memory, search_req))
     except Exception as e:
         logging.exception("Error in search_memories:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/search/batch", summary="Search memories in batch")
+async def batch_search_memories(request: Request, batch_req: BatchSearchRequest, auth: str = Depends(verify_api_key)):
+    """Run multiple searches concurrently in a single request."""
+    try:
+        memory = request.app.state.memory
+        values = await asyncio.gather(*(cached_search(memory, search_req) for search_req in batch_req.requests))
+        return MemoryJSONResponse([{"id": index, "result": value} for index, value in enumerate(values)])
+    except Exception as e:
+        logging.exception("Error in batch_search_memories:")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.put("/memories/{memory_id}", summary="Update a memory")
-def update_memory(request: Request, memory_id: str, updated_memory: Dict[str, Any], auth: str = Depends(verify_api_key)):
+async def update_memory(request: Request, memory_id: str, updated_memory: Dict[str, Any], auth: str = Depends(verify_api_key)):
     """Update an existing memory."""
     try:
-        result = MEMORY_INSTANCE.update(memory_id=memory_id, data=updated_memory)
-        cleaned_result = clean_nan_values(result)
-        return cleaned_result
+        result = await run_in_executor(request.app.state.memory.update, memory_id=memory_id, data=updated_memory)
+        SEARCH_CACHE.clear()
+        return MemoryJSONResponse(result)
     except Exception as e:
         logging.exception("Error in update_memory:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/memories/{memory_id}/history/", summary="Get memory history")
-def memory_history(request: Request, memory_id: str, auth: str = Depends(verify_api_key)):
+async def memory_history(request: Request, memory_id: str, auth: str = Depends(verify_api_key)):
     """Retrieve memory history."""
     try:
-        result = MEMORY_INSTANCE.history(memory_id=memory_id)
-        cleaned_result = clean_nan_values(result)
-        return cleaned_result
+        result = await run_in_executor(request.app.state.memory.history, memory_id=memory_id)
+        return MemoryJSONResponse(result)
     except Exception as e:
         logging.exception("Error in memory_history:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.delete("/memories/{memory_id}", summary="Delete a memory")
-def delete_memory(request: Request, memory_id: str, auth: str = Depends(verify_api_key)):
+async def delete_memory(request: Request, memory_id: str, auth: str = Depends(verify_api_key)):
     """Delete a specific memory by ID."""
     try:
-        MEMORY_INSTANCE.delete(memory_id=memory_id)
+        await run_in_executor(request.app.state.memory.delete, memory_id=memory_id)
+        SEARCH_CACHE.clear()
         return {"message": "Memory deleted successfully"}
     except Exception as e:
         logging.exception("Error in delete_memory:")
@@ -281,7 +481,7 @@ def delete_memory(request: Request, memory_id: str, auth: str = Depends(verify_a
 
 
 @app.delete("/memories/", summary="Delete all memories")
-def delete_all_memories(
+async def delete_all_memories(
     request: Request,
     user_id: Optional[str] = None,
     run_id: Optional[str] = None,
@@ -292,10 +492,9 @@ def delete_all_memories(
     if not any([user_id, run_id, agent_id]):
         raise HTTPException(status_code=400, detail="At least one identifier is required.")
     try:
-        params = {
-            k: v for k, v in {"user_id": user_id, "run_id": run_id, "agent_id": agent_id}.items() if v is not None
-        }
-        MEMORY_INSTANCE.delete_all(**params)
+        params = identifier_params(user_id=user_id, run_id=run_id, agent_id=agent_id)
+        await run_in_executor(request.app.state.memory.delete_all, **params)
+        SEARCH_CACHE.invalidate(user_id, agent_id, run_id)
         return {"message": "All relevant memories deleted"}
     except Exception as e:
         logging.exception("Error in delete_all_memories:")
@@ -303,16 +502,33 @@ def delete_all_memories(
 
 
 @app.post("/reset/", summary="Reset all memories")
-def reset_memory(request: Request, auth: str = Depends(verify_api_key)):
+async def reset_memory(request: Request, auth: str = Depends(verify_api_key)):
     """Completely reset stored memories."""
+    # Mem0 的 reset 会删除共享的 SQLite history 表，其他 worker 只在初始化时建表，之后的 add/update 都会失败
+    if WORKERS > 1:
+        raise HTTPException(status_code=409, detail="Reset is only supported when running a single worker (WORKERS=1).")
     try:
-        MEMORY_INSTANCE.reset()
+        await run_in_executor(request.app.state.memory.reset)
+        SEARCH_CACHE.clear()
+        # reset 会删除并重建集合表（不带 HNSW 索引，halfvec 列也会变回 vector），需要重新迁移
+        await run_in_executor(ensure_vector_index)
         return {"message": "All memories reset"}
     except Exception as e:
         logging.exception("Error in reset_memory:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/health/db", summary="Check database connectivity")
+async def health_db(request: Request):
+    """Ping PostgreSQL through the connection pool."""
+    try:
+        stats = await run_in_executor(ping_pool, request.app.state.pg_pool)
+        return {"status": "ok", **stats}
+    except Exception as e:
+        logging.exception("Error in health_db:")
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 @app.get("/", summary="Redirect to the OpenAPI documentation", include_in_schema=False)
 def home():
     """Redirect to the OpenAPI documentation."""
@@ -6,11 +6,25 @@ Neo4j 5.x 不允许关系类型中包含冒号，需要替换为下划线。
 """
 
 import logging
-from typing import Any, Dict, List
+import re
+from functools import lru_cache
+from typing import Any, Dict
 
 logger = logging.getLogger(__name__)
 
+# 存放关系类型的键
+_REL_KEYS = frozenset(('relationship', 'relation', 'rel_type', 'type', 'relationship_type'))
 
+# 关系类型中需要替换为下划线的字符
+_REL_TYPE_TABLE = str.maketrans({':': '_', '/': '_', '\\': '_', ' ': '_', '-': '_'})
+_MULTI_UNDERSCORE = re.compile(r'_{2,}')
+
+# 匹配 Cypher 中的关系类型：-[r:type]->、-[:type]-、<-[r:type {...}]- 等模式
+# 分组：1 为类型之前的部分，2 为关系类型，3 为类型之后的 ']'、'{' 或 '*'
+_CYPHER_REL = re.compile(r'(-\[\s*(?:[A-Za-z_]\w*)?\s*:\s*)([^\]{*]+?)(\s*[\]{*])')
+
+
+@lru_cache(maxsize=4096)
 def sanitize_relationship_type(relationship_type: str) -> str:
     """
     清理关系类型，将不符合 Neo4j 5.x 规范的字符替换掉。
@@ -28,66 +42,46 @@ def sanitize_relationship_type(relationship_type: str) -> str:
     if not relationship_type:
         return relationship_type
 
-    # 替换冒号为下划线
-    sanitized = relationship_type.replace(':', '_')
-
-    # 替换其他可能有问题的字符
-    sanitized = sanitized.replace('/', '_')
-    sanitized = sanitized.replace('\\', '_')
-    sanitized = sanitized.replace(' ', '_')
-    sanitized = sanitized.replace('-', '_')
+    # 一次性替换冒号及其他可能有问题的字符，再合并连续的下划线并移除首尾的下划线
+    sanitized = _MULTI_UNDERSCORE.sub('_', relationship_type.translate(_REL_TYPE_TABLE)).strip('_')
 
-    # 移除连续的下划线
-    while '__' in sanitized:
-        sanitized = sanitized.replace('__', '_')
+    if sanitized != relationship_type and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Sanitized relationship type: %r -> %r", relationship_type, sanitized)
 
-    # 移除首尾的下划线
-    sanitized = sanitized.strip('_')
+    return sanitized
 
-    if sanitized != relationship_type:
-        logger.debug(f"Sanitized relationship type: '{relationship_type}' -> '{sanitized}'")
 
-    return sanitized
+def _replace_relationship_type(match: re.Match) -> str:
+    return match.group(1) + sanitize_relationship_type(match.group(2)) + match.group(3)
 
 
 def sanitize_graph_data(data: Any) -> Any:
     """
-    递归清理图数据中的关系类型。
+    清理图数据中的关系类型。
+
+    使用显式栈迭代遍历，原地修改其中的字典，不再复制整棵数据结构。
 
     Args:
         data: 图数据（可以是字典、列表或其他类型）
 
     Returns:
-        清理后的图数据
+        清理后的图数据（与传入的是同一个对象）
     """
-    if isinstance(data, dict):
-        # 处理字典
-        result = {}
-        for key, value in data.items():
-            # 如果是关系类型相关的键
-            if key in ['relationship', 'relation', 'rel_type', 'type', 'relationship_type']:
-                if isinstance(value, str):
-                    result[key] = sanitize_relationship_type(value)
-                else:
-                    result[key] = sanitize_graph_data(value)
-            else:
-                result[key] = sanitize_graph_data(value)
-        return result
-
-    elif isinstance(data, list):
-        # 处理列表
-        return [sanitize_graph_data(item) for item in data]
-
-    elif isinstance(data, str):
-        # 对于字符串，检查是否看起来像关系类型
-        # 简单启发式：如果包含多个冒号，很可能是关系类型
-        if data.count(':') > 1:
-            return sanitize_relationship_type(data)
-        return data
-
-    else:
-        # 其他类型直接返回
-        return data
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                # 如果是关系类型相关的键
+                if key in _REL_KEYS and isinstance(value, str):
+                    node[key] = sanitize_relationship_type(value)
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+        elif isinstance(node, list):
+            # 关系类型只出现在 _REL_KEYS 对应的键下，列表中的字符串（实体名、URL 等）保持原样
+            stack.extend(item for item in node if isinstance(item, (dict, list)))
+
+    return data
 
 
 def patch_mem0_graph():
@@ -95,27 +89,32 @@ def patch_mem0_graph():
     给 Mem0 的图存储功能打补丁，修复 Neo4j 5.x 兼容性问题。
     """
     try:
-        from mem0.memory.graph_memory import GraphMemory
+        try:
+            from mem0.memory.graph_memory import MemoryGraph
+        except ImportError:
+            # 旧版 Mem0 中的类名
+            from mem0.memory.graph_memory import GraphMemory as MemoryGraph
 
         # 保存原始的 add 方法
-        original_add = GraphMemory.add
+        original_add = MemoryGraph.add
 
         def patched_add(self, data, filters=None):
             """修补后的 add 方法，会清理关系类型"""
-            # 清理数据中的关系类型
-            sanitized_data = sanitize_graph_data(data)
+            # Mem0 传入的通常是消息文本，只有字典或列表才可能包含关系类型
+            if isinstance(data, (dict, list)):
+                data = sanitize_graph_data(data)
 
             # 调用原始方法
-            return original_add(self, sanitized_data, filters)
+            return original_add(self, data, filters)
 
         # 替换方法
-        GraphMemory.add = patched_add
-        logger.info("Successfully patched Mem0 GraphMemory.add() for Neo4j 5.x compatibility")
+        MemoryGraph.add = patched_add
+        logger.info("Successfully patched Mem0 MemoryGraph.add() for Neo4j 5.x compatibility")
 
     except ImportError as e:
-        logger.warning(f"Could not patch Mem0 GraphMemory: {e}")
+        logger.warning(f"Could not patch Mem0 MemoryGraph: {e}")
     except Exception as e:
-        logger.error(f"Error patching Mem0 GraphMemory: {e}")
+        logger.error(f"Error patching Mem0 MemoryGraph: {e}")
 
 
 def patch_neo4j_queries():
@@ -130,22 +129,15 @@ def patch_neo4j_queries():
 
         def patched_query(self, query: str, params: Dict = None):
             """修补后的 query 方法，会清理 Cypher 查询中的关系类型"""
-            # 使用正则表达式查找并替换关系类型中的冒号
-            import re
-
-            # 匹配 -[r:type]-> 或 -[:type]-> 模式
-            def replace_relationship_type(match):
-                full_match = match.group(0)
-                rel_type = match.group(1)
-                sanitized = sanitize_relationship_type(rel_type)
-                return full_match.replace(rel_type, sanitized)
+            # 不含冒号或关系模式 '-[' 的查询不可能带有关系类型，无需正则处理
+            if ':' not in query or '-[' not in query:
+                return original_query(self, query, params)
 
             # 查找所有关系类型并替换
-            pattern = r'-\[(?:r)?:([^\]]+)\]->'
-            sanitized_query = re.sub(pattern, replace_relationship_type, query)
+            sanitized_query = _CYPHER_REL.sub(_replace_relationship_type, query)
 
-            if sanitized_query != query:
-                logger.debug(f"Sanitized Cypher query")
+            if logger.isEnabledFor(logging.DEBUG) and sanitized_query != query:
+                logger.debug("Sanitized Cypher query: %s", sanitized_query)
 
             # 调用原始方法
             return original_query(self, sanitized_query, params)
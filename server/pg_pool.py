@@ -0,0 +1,69 @@
+"""
+PostgreSQL 连接池
+
+Mem0 的 pgvector 默认连接池最多只有 5 个连接，并发请求超过上限时会直接报错或排队。
+这里预先创建一个 psycopg 连接池并通过 vector_store.config.connection_pool 注入给 Mem0，
+池大小与 mem0 线程池对齐，连接在借出前做存活检查。
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+def build_conninfo(vector_store_config: Dict[str, Any], options: Optional[str] = None) -> str:
+    """根据 Mem0 的 vector_store.config 生成 libpq 连接串"""
+    return make_conninfo(
+        host=vector_store_config["host"],
+        port=vector_store_config["port"],
+        dbname=vector_store_config["dbname"] or None,
+        user=vector_store_config["user"],
+        password=vector_store_config["password"],
+        options=options,
+    )
+
+
+def create_connection_pool(
+    vector_store_config: Dict[str, Any],
+    min_size: int = 4,
+    max_size: int = 32,
+    options: Optional[str] = None,
+) -> ConnectionPool:
+    """
+    根据 Mem0 的 vector_store.config 创建连接池。
+
+    Args:
+        vector_store_config: Mem0 的 vector_store.config 配置
+        min_size: 保持的最小连接数
+        max_size: 最大连接数
+        options: 连接启动参数（如 "-c hnsw.ef_search=100"）
+
+    Returns:
+        已打开的连接池
+    """
+    pool = ConnectionPool(
+        conninfo=build_conninfo(vector_store_config, options),
+        min_size=min_size,
+        max_size=max_size,
+        check=ConnectionPool.check_connection,
+        name="mem0-pgvector",
+        open=True,
+    )
+    logger.info(f"PostgreSQL connection pool created (min_size={min_size}, max_size={max_size})")
+    return pool
+
+
+def ping_pool(pool: ConnectionPool, timeout: float = 5.0) -> Dict[str, Any]:
+    """从连接池借出一个连接执行 SELECT 1，返回连接池状态"""
+    with pool.connection(timeout=timeout) as conn:
+        conn.execute("SELECT 1")
+    stats = pool.get_stats()
+    return {
+        "pool_size": stats.get("pool_size"),
+        "pool_available": stats.get("pool_available"),
+        "requests_waiting": stats.get("requests_waiting"),
+    }
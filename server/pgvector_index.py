@@ -0,0 +1,239 @@
+"""
+pgvector HNSW 索引迁移
+
+pgvector 的 HNSW 索引只支持不超过 2000 维的 vector 列，未建索引时每次搜索都是顺序扫描。
+这里在启动时一次性执行迁移：维度超过 2000 时把向量列转换为 halfvec（HNSW 最多支持 4000 维的 halfvec），
+然后创建 HNSW 索引。查询时的 hnsw.ef_search 由连接池的连接参数设置。
+
+超过 4000 维（或显式开启二值量化）时，改为对 binary_quantize(vector) 建立汉明距离 HNSW 索引，
+每个向量在索引中只占 dims / 8 字节；搜索时先按汉明距离取出候选，再用原始向量的余弦距离重排。
+Mem0 的搜索 SQL 无法命中表达式索引，因此需要通过 patch_pgvector_binary_search 替换其搜索方法。
+
+HNSW 索引需要 pgvector >= 0.5.0，halfvec 和 binary_quantize 需要 pgvector >= 0.7.0（按 extversion 检查）。
+Mem0 的搜索都带 user_id 等过滤条件，二值量化还会取 limit * rerank_factor 个候选，都依赖 0.8.0 加入的
+hnsw.iterative_scan，否则过滤后结果可能不足甚至为空，因此服务端安装的 pgvector 低于 0.8.0 时不建索引。
+Mem0 的 reset 会删除并重建集合表，之后需要再次调用 ensure_hnsw_index。
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+import psycopg
+from psycopg import sql
+
+from pg_pool import build_conninfo
+
+logger = logging.getLogger(__name__)
+
+# HNSW 索引支持的最大维度
+MAX_VECTOR_HNSW_DIMS = 2000
+MAX_HALFVEC_HNSW_DIMS = 4000
+# HNSW / halfvec / binary_quantize 需要的最低 pgvector 版本
+MIN_HNSW_VERSION = (0, 5, 0)
+MIN_HALFVEC_VERSION = (0, 7, 0)
+# hnsw.iterative_scan 需要的最低 pgvector 版本（由服务端加载的库提供，与 extversion 无关）
+MIN_ITERATIVE_SCAN_VERSION = (0, 8, 0)
+
+# 打补丁前 Mem0 原始的 PGVector.search，用于在二值量化索引不可用时恢复
+_original_search = None
+
+
+def _parse_version(version: str) -> tuple:
+    return tuple(int(part) for part in version.split(".")[:3])
+
+
+def ensure_hnsw_index(
+    vector_store_config: Dict[str, Any],
+    m: int = 24,
+    ef_construction: int = 128,
+    maintenance_work_mem: str = "2GB",
+    max_parallel_maintenance_workers: int = 7,
+    binary_quantization: bool = False,
+    update_extension: bool = False,
+) -> Optional[str]:
+    """
+    为 Mem0 的 pgvector 集合创建 HNSW 索引，必要时把向量列迁移为 halfvec 或使用二值量化索引。
+
+    Args:
+        vector_store_config: Mem0 的 vector_store.config 配置
+        m: HNSW 每个节点的最大连接数
+        ef_construction: 构建索引时的候选列表大小
+        maintenance_work_mem: 构建索引时使用的内存
+        max_parallel_maintenance_workers: 构建索引时的并行 worker 数
+        binary_quantization: 是否使用二值量化索引（超过 4000 维时总是使用）
+        update_extension: 是否先执行 ALTER EXTENSION vector UPDATE（数据库与其他服务共用时默认不升级）
+
+    Returns:
+        索引类型："vector"、"halfvec" 或 "binary"；未创建索引时返回 None
+    """
+    dims = vector_store_config["embedding_model_dims"]
+    use_binary = binary_quantization or dims > MAX_HALFVEC_HNSW_DIMS
+    use_halfvec = not use_binary and dims > MAX_VECTOR_HNSW_DIMS
+
+    collection_name = vector_store_config["collection_name"]
+
+    conn = psycopg.connect(build_conninfo(vector_store_config), autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            # 多个 worker 进程同时启动时串行执行迁移，锁在连接关闭时释放
+            cur.execute("SELECT pg_advisory_lock(hashtext('mem0_hnsw_index'))")
+
+            cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'vector'")
+            if not cur.fetchone():
+                logger.warning("pgvector extension not installed, skipping HNSW index")
+                return None
+
+            # pg_available_extensions 中的 default_version 即服务端安装的 pgvector 库版本
+            cur.execute("SELECT default_version FROM pg_available_extensions WHERE name = 'vector'")
+            (library_version,) = cur.fetchone()
+            if _parse_version(library_version) < MIN_ITERATIVE_SCAN_VERSION:
+                logger.warning(
+                    f"pgvector library {library_version} does not support hnsw.iterative_scan, HNSW index skipped "
+                    f"(requires >= {'.'.join(map(str, MIN_ITERATIVE_SCAN_VERSION))})"
+                )
+                return None
+
+            if update_extension:
+                # 升级 vector 扩展到镜像自带的最新版本
+                cur.execute("ALTER EXTENSION vector UPDATE")
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            (version,) = cur.fetchone()
+
+            if _parse_version(version) < MIN_HNSW_VERSION:
+                logger.warning(
+                    f"pgvector {version} does not support HNSW, index skipped "
+                    f"(requires >= {'.'.join(map(str, MIN_HNSW_VERSION))})"
+                )
+                return None
+
+            if (use_binary or use_halfvec) and _parse_version(version) < MIN_HALFVEC_VERSION:
+                logger.warning(
+                    f"pgvector {version} does not support halfvec or binary_quantize, HNSW index for {dims} dims skipped "
+                    f"(requires >= {'.'.join(map(str, MIN_HALFVEC_VERSION))})"
+                )
+                return None
+
+            # 旧版 Mem0 建表时未加引号（表名被转为小写），新版会加引号，两种情况都要兼容
+            cur.execute(
+                "SELECT c.oid::regclass::text, c.relname, format_type(a.atttypid, a.atttypmod) "
+                "FROM pg_class c JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname = 'vector' "
+                "WHERE c.oid = coalesce(to_regclass(quote_ident(%s)), to_regclass(%s))",
+                (collection_name, collection_name),
+            )
+            row = cur.fetchone()
+            if not row:
+                logger.warning(f"Table {collection_name} not found, skipping HNSW index")
+                return None
+            table, relname, column_type = row
+
+            if use_halfvec:
+                if not column_type.startswith("halfvec"):
+                    logger.info(f"Converting {table}.vector to halfvec({dims})...")
+                    cur.execute(
+                        sql.SQL("ALTER TABLE {} ALTER COLUMN vector TYPE halfvec({}) USING vector::halfvec({})").format(
+                            sql.SQL(table), sql.Literal(dims), sql.Literal(dims)
+                        )
+                    )
+
+            if use_binary:
+                index_type = "binary"
+                index_name = f"{relname}_bq_hnsw_idx"
+                expression = sql.SQL("(binary_quantize(vector)::bit({})) bit_hamming_ops").format(sql.Literal(dims))
+            else:
+                index_type = "halfvec" if use_halfvec else "vector"
+                index_name = f"{relname}_hnsw_idx"
+                expression = sql.SQL(f"vector {index_type}_cosine_ops")
+
+            # psycopg 3 使用服务端参数绑定，SET 语句不支持参数，这里改用 set_config
+            cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+            cur.execute(
+                "SELECT set_config('max_parallel_maintenance_workers', %s, false)", (str(max_parallel_maintenance_workers),)
+            )
+            cur.execute(
+                sql.SQL(
+                    "CREATE INDEX IF NOT EXISTS {} ON {} USING hnsw ({}) WITH (m = {}, ef_construction = {})"
+                ).format(
+                    sql.Identifier(index_name),
+                    sql.SQL(table),
+                    expression,
+                    sql.Literal(m),
+                    sql.Literal(ef_construction),
+                )
+            )
+
+            logger.info(f"HNSW index ready on {table} ({index_type}, m={m}, ef_construction={ef_construction})")
+            return index_type
+    finally:
+        conn.close()
+
+
+def patch_pgvector_binary_search(dims: int, rerank_factor: int = 4):
+    """
+    给 Mem0 的 PGVector.search 打补丁，使其命中二值量化 HNSW 索引。
+
+    先按汉明距离取出 limit * rerank_factor 个候选，再按原始向量的余弦距离重排并截取 limit 条。
+    重复调用时只替换一次；索引不存在时该查询比 Mem0 原始查询更慢，应调用 restore_pgvector_search 恢复。
+
+    Args:
+        dims: 向量维度，需与索引表达式中的 bit(dims) 一致
+        rerank_factor: 候选数量相对 limit 的倍数
+    """
+    global _original_search
+    if _original_search is not None:
+        return
+
+    try:
+        from mem0.vector_stores.pgvector import OutputData, PGVector
+
+        def patched_search(self, query: str, vectors: List[float], limit: Optional[int] = 5, filters: Optional[dict] = None):
+            """修补后的 search 方法，使用二值量化索引粗排并用原始向量重排"""
+            filter_conditions = []
+            filter_params = []
+
+            if filters:
+                for k, v in filters.items():
+                    filter_conditions.append("payload->>%s = %s")
+                    filter_params.extend([k, str(v)])
+
+            filter_clause = "WHERE " + " AND ".join(filter_conditions) if filter_conditions else ""
+
+            with self._get_cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT id, vector <=> %s::vector AS distance, payload
+                    FROM (
+                        SELECT id, vector, payload
+                        FROM {self.collection_name}
+                        {filter_clause}
+                        ORDER BY binary_quantize(vector)::bit({dims}) <~> binary_quantize(%s::vector)
+                        LIMIT %s
+                    ) candidates
+                    ORDER BY distance
+                    LIMIT %s
+                    """,
+                    (vectors, *filter_params, vectors, limit * rerank_factor, limit),
+                )
+                results = cur.fetchall()
+            return [OutputData(id=str(r[0]), score=float(r[1]), payload=r[2]) for r in results]
+
+        _original_search = PGVector.search
+        PGVector.search = patched_search
+        logger.info(f"Successfully patched Mem0 PGVector.search() for binary quantized HNSW index (rerank_factor={rerank_factor})")
+
+    except ImportError as e:
+        logger.warning(f"Could not patch Mem0 PGVector: {e}")
+    except Exception as e:
+        logger.error(f"Error patching Mem0 PGVector: {e}")
+
+
+def restore_pgvector_search():
+    """恢复 Mem0 原始的 PGVector.search（未打补丁时不做任何事）"""
+    global _original_search
+    if _original_search is None:
+        return
+
+    from mem0.vector_stores.pgvector import PGVector
+
+    PGVector.search = _original_search
+    _original_search = None
+    logger.warning("Binary quantized HNSW index unavailable, restored Mem0 PGVector.search()")
@@ -0,0 +1,171 @@
+"""
+搜索结果缓存
+
+两级缓存：
+- 精确匹配：相同标识、参数和查询文本直接命中，跳过 Embedder 和 pgvector。
+- 语义匹配：同一作用域内查询向量余弦相似度超过阈值时命中，跳过 pgvector。
+
+缓存只在事件循环线程中访问，不需要加锁。
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import orjson
+from cachetools import LRUCache, TTLCache
+
+IDENTIFIER_KEYS = ("user_id", "agent_id", "run_id")
+# filters 中的标识不是单个字符串（如 {"in": [...]}）时使用，失效时与任意对应标识匹配
+ANY_IDENTIFIER = object()
+
+
+class SemanticEntries:
+    """
+    单个作用域内的查询向量环形缓冲区。
+
+    向量按行连续存放在一个 float32 矩阵中，查找时一次矩阵乘法即可算出全部余弦相似度，
+    过期和阈值判断也都在 numpy 中以向量化方式完成。矩阵按需倍增，直到达到容量上限。
+    """
+
+    def __init__(self, capacity: int, dims: int):
+        self.capacity = capacity
+        self.vectors = np.empty((min(8, capacity), dims), dtype=np.float32)
+        self.expires = np.empty(len(self.vectors), dtype=np.float64)
+        self.values: List[Any] = []
+        self.next = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, expires_at: float, vector: np.ndarray, value: Any):
+        size = len(self.values)
+        if size < self.capacity:
+            if size == len(self.vectors):
+                grown = min(size * 2, self.capacity)
+                self.vectors = np.resize(self.vectors, (grown, self.vectors.shape[1]))
+                self.expires = np.resize(self.expires, grown)
+            index = size
+            self.values.append(value)
+        else:
+            # 已满时覆盖最早写入的条目
+            index = self.next
+            self.values[index] = value
+        self.vectors[index] = vector
+        self.expires[index] = expires_at
+        self.next = (index + 1) % self.capacity
+
+    def best_match(self, vector: np.ndarray, now: float, threshold: float) -> Optional[Any]:
+        size = len(self.values)
+        if vector.shape[0] != self.vectors.shape[1]:
+            return None
+        scores = self.vectors[:size] @ vector
+        scores[self.expires[:size] <= now] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            return self.values[best]
+        return None
+
+    def expired(self, now: float) -> bool:
+        return not (self.expires[: len(self.values)] > now).any()
+
+
+class SearchCache:
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        ttl: float = 300,
+        semantic_size: int = 64,
+        semantic_threshold: float = 0.97,
+        semantic_scopes: int = 256,
+    ):
+        # maxsize 为 0 表示禁用缓存
+        self.enabled = maxsize > 0
+        self.ttl = ttl
+        self.semantic_size = semantic_size
+        self.semantic_threshold = semantic_threshold
+        self.generation = 0
+        self._exact: TTLCache = TTLCache(maxsize=max(maxsize, 1), ttl=ttl)
+        # 限制保留语义缓存的作用域数量，淘汰最久未使用的作用域
+        self._semantic: LRUCache = LRUCache(maxsize=semantic_scopes)
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.enabled and self.semantic_size > 0
+
+    @staticmethod
+    def make_scope(params: Dict[str, Any]) -> Tuple:
+        """由搜索参数（不含 query）构造缓存作用域"""
+        filters = params.get("filters")
+        return (
+            *(SearchCache._identifier(params, filters, k) for k in IDENTIFIER_KEYS),
+            params.get("threshold"),
+            params.get("limit"),
+            orjson.dumps(filters, option=orjson.OPT_SORT_KEYS, default=str) if filters else None,
+        )
+
+    @staticmethod
+    def _identifier(params: Dict[str, Any], filters: Optional[Dict[str, Any]], key: str) -> Any:
+        """取作用域中的标识，未在参数中给出时使用 filters 中的同名标识"""
+        if params.get(key) is not None:
+            return params[key]
+        if not filters or filters.get(key) is None:
+            return None
+        value = filters[key]
+        return value if isinstance(value, str) else ANY_IDENTIFIER
+
+    def get(self, scope: Tuple, query: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        return self._exact.get(scope + (query,))
+
+    def get_similar(self, scope: Tuple, embedding: Sequence[float]) -> Optional[Any]:
+        """在同一作用域内查找语义相近的历史查询结果"""
+        entries = self._semantic.get(scope)
+        if not entries:
+            return None
+
+        now = time.monotonic()
+        if entries.expired(now):
+            del self._semantic[scope]
+            return None
+
+        return entries.best_match(self._normalize(embedding), now, self.semantic_threshold)
+
+    def put(self, scope: Tuple, query: str, value: Any, embedding: Optional[Sequence[float]] = None, generation: Optional[int] = None):
+        """写入缓存；若期间发生过失效（generation 变化），则丢弃该结果"""
+        if not self.enabled or (generation is not None and generation != self.generation):
+            return
+        self._exact[scope + (query,)] = value
+        if embedding is not None and self.semantic_enabled:
+            vector = self._normalize(embedding)
+            entries = self._semantic.get(scope)
+            if entries is None:
+                entries = self._semantic[scope] = SemanticEntries(self.semantic_size, vector.shape[0])
+            entries.append(time.monotonic() + self.ttl, vector, value)
+
+    def invalidate(self, user_id: Optional[str] = None, agent_id: Optional[str] = None, run_id: Optional[str] = None):
+        """使与任一给定标识相关的缓存失效"""
+        self.generation += 1
+        targets = (user_id, agent_id, run_id)
+
+        def matches(scope: Tuple) -> bool:
+            return any(
+                value is not None and (scope[i] is ANY_IDENTIFIER or scope[i] == value) for i, value in enumerate(targets)
+            )
+
+        for key in [k for k in self._exact.keys() if matches(k)]:
+            self._exact.pop(key, None)
+        for scope in [s for s in self._semantic.keys() if matches(s)]:
+            self._semantic.pop(scope, None)
+
+    def clear(self):
+        self.generation += 1
+        self._exact.clear()
+        self._semantic.clear()
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec